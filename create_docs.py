@@ -4,6 +4,8 @@ Run this script to generate the docs/ directory with sample .txt files.
 """
 
 import os
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 def create_sample_documents():
     """Create sample documents in docs/ directory"""
@@ -123,13 +125,23 @@ Items marked as final sale, gift cards, downloadable software, and intimate appa
         'return_policy.txt': doc4
     }
     
+    # Skip files that already exist so reruns don't rewrite them
+    todo = []
     for filename, content in documents.items():
         filepath = os.path.join('docs', filename)
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(content)
-        print(f"Created: {filepath}")
+        if os.path.exists(filepath):
+            print(f"Skipped (exists): {filepath}")
+        else:
+            todo.append((filepath, content))
     
-    print(f"\nSuccessfully created {len(documents)} sample documents in 'docs/' directory")
+    # Write the remaining files concurrently
+    if todo:
+        with ThreadPoolExecutor(max_workers=len(todo)) as executor:
+            list(executor.map(lambda item: Path(item[0]).write_text(item[1], encoding='utf-8'), todo))
+        for filepath, _ in todo:
+            print(f"Created: {filepath}")
+    
+    print(f"\nSuccessfully created {len(todo)} sample documents in 'docs/' directory")
 
 
 if __name__ == "__main__":
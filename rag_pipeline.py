@@ -1,42 +1,166 @@
 import os
 import re
-import string
+import hashlib
+import joblib
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import normalize
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 
-class Document:
-    """Represents a document with metadata"""
-    def __init__(self, filename, content):
-        self.filename = filename
-        self.content = content
+# Dense retrieval is optional; fall back to TF-IDF when these are unavailable
+try:
+    import faiss
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    faiss = None
+    SentenceTransformer = None
+
+# Numba JIT-compiles the sentence scoring kernel; without it the kernel runs as plain Python
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        def decorator(func):
+            return func
+        return decorator
+
+# Optional BM25 prefilter for dense retrieval
+try:
+    from rank_bm25 import BM25Okapi
+except ImportError:
+    BM25Okapi = None
+
+# Bump when the cached index layout or the way passages/features are built changes
+_CACHE_VERSION = 2
+
+_PUNCT_RE = re.compile(r'[^\w\s]')
+_WS_RE = re.compile(r'\s+')
+_DIGIT_RE = re.compile(r'\d+')
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+# Common question words to ignore when extracting keywords
+_STOP = frozenset({'what', 'is', 'the', 'how', 'do', 'i', 'does', 'have', 'for',
+                   'many', 'long', 'to', 'a', 'an', 'are', 'get', 'can', 'my',
+                   'schedule', 'take'})
+
+def _top_k(scores, k):
+    """Indices of the k highest scores in descending order"""
+    if k >= len(scores):
+        return np.argsort(-scores)
+    # Partition first, then sort only the k candidates
+    idx = np.argpartition(scores, -k)[-k:]
+    return idx[np.argsort(-scores[idx])]
+
+@njit(cache=True)
+def _score_sentences(token_ids, offsets, word_counts, has_digit, keyword_ids, query_word_ids):
+    """Score every sentence of a passage against the query token IDs"""
+    n = len(word_counts)
+    scores = np.zeros(n, dtype=np.int32)
+    for i in range(n):
+        # Each sentence's token IDs are sorted and unique, so membership is a binary search
+        sent_ids = token_ids[offsets[i]:offsets[i + 1]]
+        score = 0
+        
+        # Count exact keyword matches
+        for kw in keyword_ids:
+            j = np.searchsorted(sent_ids, kw)
+            if j < len(sent_ids) and sent_ids[j] == kw:
+                score += 2
+        
+        # Bonus for containing question-related words
+        for qw in query_word_ids:
+            j = np.searchsorted(sent_ids, qw)
+            if j < len(sent_ids) and sent_ids[j] == qw:
+                score += 1
+        
+        # Penalize very long sentences (likely paragraphs)
+        if word_counts[i] > 50:
+            score -= 2
+        
+        # Bonus for sentences with numbers (often contain specific facts)
+        if has_digit[i]:
+            score += 1
+        
+        scores[i] = score
+    return scores
 
 class Passage:
     """Represents a passage/chunk with metadata"""
-    def __init__(self, text, source, passage_id):
+    def __init__(self, text, source, passage_id, sentences=None, vocab=None):
         self.text = text
         self.source = source
         self.passage_id = passage_id
+        # Sentence splits and per-sentence features are cached at ingest
+        # so answer generation never re-splits or re-scans text
+        self.sentences = sentences if sentences is not None else []
+        self.sentence_word_counts = np.array([len(s.split()) for s in self.sentences], dtype=np.int32)
+        self.sentence_has_digit = np.array([_DIGIT_RE.search(s) is not None for s in self.sentences], dtype=np.bool_)
+        
+        # Sorted unique token IDs per sentence, flattened: sentence i owns
+        # sentence_token_ids[sentence_offsets[i]:sentence_offsets[i + 1]]
+        vocab = vocab if vocab is not None else {}
+        sentence_ids = [sorted({vocab.setdefault(t, len(vocab)) for t in _TOKEN_RE.findall(s.lower())})
+                        for s in self.sentences]
+        self.sentence_offsets = np.zeros(len(sentence_ids) + 1, dtype=np.int64)
+        np.cumsum([len(ids) for ids in sentence_ids], out=self.sentence_offsets[1:])
+        self.sentence_token_ids = np.fromiter((i for ids in sentence_ids for i in ids), dtype=np.int32,
+                                              count=int(self.sentence_offsets[-1]))
+    
+    @classmethod
+    def from_dict(cls, state):
+        """Rebuild a passage from its cached attributes without recomputing features"""
+        passage = cls.__new__(cls)
+        passage.__dict__.update(state)
+        return passage
 
 class RAGSystem:
-    def __init__(self, docs_dir='docs', max_words_per_passage=120):
+    def __init__(self, docs_dir='docs', max_words_per_passage=120, overlap_words=None, cache_dir='.rag_cache',
+                 use_dense=True, embedding_model='BAAI/bge-small-en-v1.5', query_prefix='',
+                 dense_tfidf_max_mb=200, dense_tfidf_min_density=0.1,
+                 tfidf_min_score=0.01, dense_min_score=0.5):
         self.docs_dir = docs_dir
         self.max_words_per_passage = max_words_per_passage
-        self.documents = []
+        # Default overlap is ~10% of the passage size
+        self.overlap_words = max_words_per_passage // 10 if overlap_words is None else overlap_words
+        self.cache_dir = cache_dir
+        self.cache_path = None
         self.passages = []
-        self.vectorizer = TfidfVectorizer()
+        # Token -> int ID shared by all passages, used by the sentence scoring kernel
+        self.vocab = {}
+        # Hashed term counts need no vocabulary, so memory is fixed at n_features;
+        # IDF is then fitted on the hashed matrix without a second pass over the text
+        self.vectorizer = make_pipeline(
+            HashingVectorizer(preprocessor=self.preprocess_text, n_features=2**18,
+                              alternate_sign=False, norm=None, dtype=np.float32),
+            TfidfTransformer(sublinear_tf=True, norm='l2'))
         self.passage_vectors = None
-        
-    def preprocess_text(self, text):
+        # Contiguous float32 copy of the TF-IDF matrix restricted to the features
+        # passages actually use, built only when it is dense enough to beat the
+        # CSR path and fits within dense_tfidf_max_mb
+        self.dense_tfidf_max_mb = dense_tfidf_max_mb
+        self.dense_tfidf_min_density = dense_tfidf_min_density
+        self.active_features = None
+        self.passage_matrix = None
+        # Dense retrieval state (SentenceTransformer embeddings in a FAISS inner-product index)
+        self.use_dense = use_dense and faiss is not None and SentenceTransformer is not None
+        self.embedding_model = embedding_model
+        self.query_prefix = query_prefix
+        self.encoder = None
+        self.passage_embeddings = None
+        self.index = None
+        self.bm25 = None
+        # Below these top-passage scores the query is treated as unanswerable. Normalized
+        # embeddings score unrelated text far above TF-IDF's near-zero, so each method
+        # needs its own cutoff
+        self.tfidf_min_score = tfidf_min_score
+        self.dense_min_score = dense_min_score
+        
+    @staticmethod
+    def preprocess_text(text):
         """Preprocess text: lowercase, remove punctuation, normalize whitespace"""
-        # Lowercase
-        text = text.lower()
-        # Remove punctuation
-        text = text.translate(str.maketrans('', '', string.punctuation))
-        # Normalize whitespace
-        text = ' '.join(text.split())
-        return text
+        return _WS_RE.sub(' ', _PUNCT_RE.sub(' ', text.lower())).strip()
     
     def split_into_sentences(self, text):
         """Split text into sentences with better handling"""
@@ -54,31 +178,99 @@ class RAGSystem:
         return cleaned_sentences
     
     def create_passages(self, text, filename):
-        """Split document into passages of ~120 words"""
+        """Split document into passages of ~120 words with ~10% sentence overlap"""
         sentences = self.split_into_sentences(text)
-        passages = []
-        current_passage = []
-        current_word_count = 0
+        if not sentences:
+            return []
         
-        for sentence in sentences:
-            words = sentence.split()
-            word_count = len(words)
-            
-            # If adding this sentence exceeds limit, save current passage
-            if current_word_count + word_count > self.max_words_per_passage and current_passage:
-                passages.append(' '.join(current_passage))
-                current_passage = [sentence]
-                current_word_count = word_count
-            else:
-                current_passage.append(sentence)
-                current_word_count += word_count
-        
-        # Add remaining passage
-        if current_passage:
-            passages.append(' '.join(current_passage))
+        # Prefix sums of word counts: words in sentences[i:j] == bounds[j] - bounds[i]
+        word_counts = np.fromiter((len(s.split()) for s in sentences), dtype=np.int32, count=len(sentences))
+        bounds = np.concatenate(([0], np.cumsum(word_counts)))
+        
+        def window_end(start):
+            # Last sentence that keeps the passage within the word limit (at least one sentence)
+            end = int(np.searchsorted(bounds, bounds[start] + self.max_words_per_passage, side='right')) - 1
+            return max(end, start + 1)
+        
+        passages = []
+        start = end = 0
+        while end < len(sentences):
+            next_end = window_end(start)
+            if next_end <= end:
+                # Overlap plus the next sentence exceeds the limit, which would yield
+                # a passage with no new content: drop the overlap instead
+                start = end
+                next_end = window_end(start)
+            end = next_end
+            passages.append(' '.join(sentences[start:end]))
+            # Start the next passage with trailing sentences that fit in the overlap budget
+            start = int(np.searchsorted(bounds, bounds[end] - self.overlap_words, side='left'))
         
         return passages
     
+    @staticmethod
+    def read_file(filepath):
+        """Read a text file as UTF-8"""
+        with open(filepath, 'r', encoding='utf-8') as f:
+            return f.read()
+    
+    def index_config(self):
+        """Describe every setting that shapes the cached index contents"""
+        hashing, tfidf = (step for _, step in self.vectorizer.steps)
+        # The preprocessor is a function whose repr varies between runs; the regexes it uses are hashed instead
+        hashing_params = {k: v for k, v in hashing.get_params().items() if k != 'preprocessor'}
+        return repr((_CACHE_VERSION, self.max_words_per_passage, self.overlap_words, self.embedding_model,
+                     sorted(hashing_params.items()), sorted(tfidf.get_params().items()),
+                     _PUNCT_RE.pattern, _WS_RE.pattern, _TOKEN_RE.pattern, _DIGIT_RE.pattern))
+    
+    def corpus_hash(self, txt_files):
+        """Hash file names, mtimes and sizes (plus index settings) to key the index cache"""
+        h = hashlib.sha256()
+        h.update(f"{self.index_config()}\n".encode('utf-8'))
+        for filename in sorted(txt_files):
+            st = os.stat(os.path.join(self.docs_dir, filename))
+            h.update(f"{filename}\0{st.st_mtime_ns}\0{st.st_size}\n".encode('utf-8'))
+        return h.hexdigest()
+    
+    def load_cache(self):
+        """Load passages, TF-IDF index and embeddings from disk cache, returns True on success"""
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return False
+        try:
+            cache = joblib.load(self.cache_path)
+            if cache['version'] != _CACHE_VERSION:
+                raise ValueError(f"cache version {cache['version']} != {_CACHE_VERSION}")
+            self.passages = [Passage.from_dict(state) for state in cache['passages']]
+            self.vocab = cache['vocab']
+            # The hashing step is stateless; only the fitted IDF weights are restored
+            self.vectorizer.steps[-1] = (self.vectorizer.steps[-1][0], cache['tfidf'])
+            self.passage_vectors = cache['passage_vectors']
+            self.passage_embeddings = cache['passage_embeddings']
+        except Exception as e:
+            print(f"Warning: could not load index cache '{self.cache_path}': {e}")
+            self.passages, self.vocab, self.passage_vectors, self.passage_embeddings = [], {}, None, None
+            return False
+        return True
+    
+    def save_cache(self):
+        """Write passages, TF-IDF index and embeddings to disk cache"""
+        if not self.cache_path:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Store plain data only (no classes from this module), so the cache loads
+            # the same whether this file runs as a script or is imported
+            joblib.dump({
+                'version': _CACHE_VERSION,
+                'passages': [vars(p) for p in self.passages],
+                'vocab': self.vocab,
+                'tfidf': self.vectorizer.steps[-1][1],
+                'passage_vectors': self.passage_vectors,
+                'passage_embeddings': self.passage_embeddings,
+            }, self.cache_path)
+        except OSError as e:
+            print(f"Warning: could not write index cache '{self.cache_path}': {e}")
+    
     def ingest_documents(self):
         """Read all .txt files from docs directory"""
         if not os.path.exists(self.docs_dir):
@@ -93,58 +285,173 @@ class RAGSystem:
         
         print(f"Found {len(txt_files)} documents")
         
-        for filename in txt_files:
-            filepath = os.path.join(self.docs_dir, filename)
-            with open(filepath, 'r', encoding='utf-8') as f:
-                content = f.read()
-                self.documents.append(Document(filename, content))
-                
-                # Create passages from this document
-                passages = self.create_passages(content, filename)
-                for i, passage_text in enumerate(passages):
-                    passage_id = f"{filename}_passage_{i}"
-                    self.passages.append(Passage(passage_text, filename, passage_id))
-        
-        print(f"Created {len(self.passages)} passages from {len(self.documents)} documents")
+        # Warm start: reuse the cached passages and index if the corpus is unchanged
+        if self.cache_dir:
+            self.cache_path = os.path.join(self.cache_dir, f"{self.corpus_hash(txt_files)}.joblib")
+            if self.load_cache():
+                print(f"Loaded {len(self.passages)} passages from cache")
+                return
+        
+        # Read files concurrently to overlap I/O latency. Reads are submitted one
+        # worker-sized batch at a time, so at most max_workers file contents are in
+        # memory at once; only passages are kept after a file has been chunked
+        n_docs = len(txt_files)
+        max_workers = min(32, n_docs)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for batch_start in range(0, n_docs, max_workers):
+                batch = txt_files[batch_start:batch_start + max_workers]
+                filepaths = [os.path.join(self.docs_dir, filename) for filename in batch]
+                for filename, content in zip(batch, executor.map(self.read_file, filepaths)):
+                    # Create passages from this document
+                    passages = self.create_passages(content, filename)
+                    for i, passage_text in enumerate(passages):
+                        passage_id = f"{filename}_passage_{i}"
+                        sentences = self.split_into_sentences(passage_text)
+                        self.passages.append(Passage(passage_text, filename, passage_id, sentences, self.vocab))
+        
+        print(f"Created {len(self.passages)} passages from {n_docs} documents")
+    
+    def load_encoder(self):
+        """Load the SentenceTransformer model, returns True on success"""
+        if self.encoder is not None:
+            return True
+        try:
+            self.encoder = SentenceTransformer(self.embedding_model)
+        except Exception as e:
+            print(f"Warning: could not load embedding model '{self.embedding_model}': {e}")
+            print("Falling back to TF-IDF retrieval")
+            self.use_dense = False
+            return False
+        return True
+    
+    def encode(self, texts):
+        """Encode texts into L2-normalized float32 embeddings"""
+        embeddings = self.encoder.encode(texts, batch_size=64, normalize_embeddings=True,
+                                         convert_to_numpy=True, show_progress_bar=False)
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
     
     def index_passages(self):
-        """Index passages using TF-IDF"""
+        """Index passages using TF-IDF, plus dense embeddings when available"""
         if not self.passages:
             print("No passages to index!")
             return
         
-        # Preprocess all passages
-        preprocessed_passages = [self.preprocess_text(p.text) for p in self.passages]
+        updated = False
+        
+        if self.passage_vectors is None:
+            # Create TF-IDF vectors (the vectorizer applies preprocess_text itself),
+            # L2-normalized once so retrieval is a plain dot product
+            passage_vectors = self.vectorizer.fit_transform(p.text for p in self.passages)
+            self.passage_vectors = normalize(passage_vectors, norm='l2', copy=False).tocsr()
+            updated = True
+        
+        self.build_passage_matrix()
+        
+        if self.use_dense and self.passage_embeddings is None and self.load_encoder():
+            self.passage_embeddings = self.encode([p.text for p in self.passages])
+            updated = True
+        
+        if self.use_dense and self.passage_embeddings is not None and self.load_encoder():
+            # Inner product on normalized embeddings is cosine similarity
+            self.index = faiss.IndexFlatIP(self.passage_embeddings.shape[1])
+            self.index.add(self.passage_embeddings)
+            # Cheap lexical prefilter so large corpora only dense-score a candidate set
+            if BM25Okapi is not None:
+                self.bm25 = BM25Okapi(self.preprocess_text(p.text).split() for p in self.passages)
+        
+        method = "dense embeddings" if self.index is not None else "TF-IDF"
+        if updated:
+            print(f"Indexed {len(self.passages)} passages ({method})")
+            self.save_cache()
+        else:
+            print(f"Using cached index for {len(self.passages)} passages ({method})")
+    
+    def build_passage_matrix(self):
+        """Densify the TF-IDF matrix over its active features when it is dense and small enough"""
+        self.active_features, self.passage_matrix = None, None
+        # Features no passage uses score zero for every query, so they can be dropped
+        active_features = np.unique(self.passage_vectors.indices)
+        n_cells = self.passage_vectors.shape[0] * len(active_features)
+        if n_cells == 0:
+            return
+        # Sparse rows would make every query scan mostly zeros; keep the CSR path for them
+        if self.passage_vectors.nnz / n_cells < self.dense_tfidf_min_density:
+            return
+        if n_cells * np.dtype(np.float32).itemsize > self.dense_tfidf_max_mb * 1024 * 1024:
+            return
+        self.active_features = active_features
+        self.passage_matrix = np.ascontiguousarray(
+            self.passage_vectors[:, active_features].toarray(), dtype=np.float32)
+    
+    def search_tfidf(self, queries, k):
+        """Return a list of (indices, scores) of the top-k passages per query by TF-IDF cosine similarity"""
+        # Vectorize all queries in one call; the vectorizer already emits L2-normalized float32 rows
+        query_vectors = self.vectorizer.transform(queries)
+        
+        # Cosine similarity reduces to a dot product on normalized vectors: (Q, N) scores
+        if self.passage_matrix is not None:
+            # BLAS matrix product over the contiguous dense copy
+            query_matrix = query_vectors[:, self.active_features].toarray()
+            similarities = query_matrix @ self.passage_matrix.T
+        else:
+            similarities = self.passage_vectors.dot(query_vectors.T).toarray().T
+        hits = []
+        for row in similarities:
+            top_k_indices = _top_k(row, k)
+            hits.append((top_k_indices, row[top_k_indices]))
+        return hits
+    
+    def search_index(self, query_embeddings, k):
+        """Return a list of (indices, scores) per query from a full FAISS search"""
+        scores, indices = self.index.search(query_embeddings, min(k, self.index.ntotal))
+        # FAISS pads with -1 when fewer than k results exist
+        found = indices >= 0
+        return [(idx[f], sc[f]) for idx, sc, f in zip(indices, scores, found)]
+    
+    def search_dense(self, queries, k):
+        """Return a list of (indices, scores) of the top-k passages per query by embedding cosine similarity"""
+        query_embeddings = self.encode([self.query_prefix + q for q in queries])
+        
+        # Two-stage retrieval: BM25 picks the top-omega candidates, dense scores rerank them
+        omega = max(50, 10 * k)
+        if self.bm25 is None or omega >= self.index.ntotal:
+            return self.search_index(query_embeddings, k)
+        
+        hits = []
+        for query, query_embedding in zip(queries, query_embeddings):
+            bm25_scores = self.bm25.get_scores(self.preprocess_text(query).split())
+            # Without enough lexical matches BM25 would pick arbitrary candidates,
+            # which is exactly the case dense retrieval is for: search everything
+            if np.count_nonzero(bm25_scores > 0) < k:
+                hits.extend(self.search_index(query_embedding[np.newaxis], k))
+                continue
+            candidates = np.argpartition(bm25_scores, -omega)[-omega:]
+            dense_scores = self.passage_embeddings[candidates] @ query_embedding
+            top = _top_k(dense_scores, k)
+            hits.append((candidates[top], dense_scores[top]))
+        return hits
+    
+    def retrieve_batch(self, queries, k=3):
+        """Retrieve top-k relevant passages for several queries with one vectorization pass"""
+        if self.index is not None:
+            hits = self.search_dense(queries, k)
+        else:
+            hits = self.search_tfidf(queries, k)
         
-        # Create TF-IDF vectors
-        self.passage_vectors = self.vectorizer.fit_transform(preprocessed_passages)
-        print(f"Indexed {len(self.passages)} passages")
+        return [
+            [{'passage': self.passages[idx], 'score': float(score)} for idx, score in zip(indices, scores)]
+            for indices, scores in hits
+        ]
     
     def retrieve(self, query, k=3, debug=False):
         """Retrieve top-k relevant passages"""
-        # Preprocess query
-        preprocessed_query = self.preprocess_text(query)
-        
         if debug:
+            # The vectorizer preprocesses the query itself; this is only for display
             print(f"\n--- DEBUG: Preprocessed Query ---")
             print(f"Original: {query}")
-            print(f"Preprocessed: {preprocessed_query}")
-        
-        # Vectorize query
-        query_vector = self.vectorizer.transform([preprocessed_query])
-        
-        # Compute cosine similarities
-        similarities = cosine_similarity(query_vector, self.passage_vectors)[0]
+            print(f"Preprocessed: {self.preprocess_text(query)}")
         
-        # Get top-k indices
-        top_k_indices = np.argsort(similarities)[-k:][::-1]
-        
-        results = []
-        for idx in top_k_indices:
-            results.append({
-                'passage': self.passages[idx],
-                'score': similarities[idx]
-            })
+        results = self.retrieve_batch([query], k=k)[0]
         
         if debug:
             print(f"\n--- DEBUG: Top {k} Retrieved Passages ---")
@@ -158,97 +465,74 @@ class RAGSystem:
     
     def extract_keywords(self, query):
         """Extract potential keywords from query"""
-        # Common question words to ignore
-        stop_words = {'what', 'is', 'the', 'how', 'do', 'i', 'does', 'have', 'for', 
-                      'many', 'long', 'to', 'a', 'an', 'are', 'get', 'can', 'my',
-                      'schedule', 'take'}
-        
-        words = query.lower().split()
-        keywords = [w.strip(string.punctuation) for w in words if w.lower() not in stop_words]
-        return keywords
-    
-    def score_sentence_relevance(self, sentence, keywords, query_lower):
-        """Score how relevant a sentence is to the query"""
-        sentence_lower = sentence.lower()
-        score = 0
-        
-        # Count exact keyword matches
-        for keyword in keywords:
-            if keyword in sentence_lower:
-                score += 2
-        
-        # Bonus for containing question-related words
-        query_words = query_lower.split()
-        for word in query_words:
-            if len(word) > 3 and word in sentence_lower:
-                score += 1
-        
-        # Penalize very long sentences (likely paragraphs)
-        word_count = len(sentence.split())
-        if word_count > 50:
-            score -= 2
-        
-        # Bonus for sentences with numbers (often contain specific facts)
-        if re.search(r'\d+', sentence):
-            score += 1
-            
-        return score
+        # Tokenize the same way as sentence token IDs so lookups line up
+        return [t for t in _TOKEN_RE.findall(query.lower()) if t not in _STOP]
     
     def generate_answer(self, query, retrieved_results, debug=False):
         """Generate concise answer from retrieved passages"""
-        if not retrieved_results or retrieved_results[0]['score'] < 0.01:
+        min_score = self.dense_min_score if self.index is not None else self.tfidf_min_score
+        if not retrieved_results or retrieved_results[0]['score'] < min_score:
             return "I couldn't find relevant information to answer this question.", []
         
         # Extract keywords from query
         keywords = self.extract_keywords(query)
-        query_lower = query.lower()
+        query_words = _TOKEN_RE.findall(query.lower())
+        
+        # Map query tokens to vocabulary IDs (-1 never matches a sentence)
+        keyword_ids = np.array([self.vocab.get(w, -1) for w in keywords], dtype=np.int32)
+        query_word_ids = np.array([self.vocab.get(w, -1) for w in query_words if len(w) > 3], dtype=np.int32)
         
         if debug:
             print(f"\n--- DEBUG: Answer Generation ---")
             print(f"Keywords extracted: {keywords}")
         
-        # Collect all candidate sentences with scores
-        candidate_sentences = []
+        # Collect candidate sentences as parallel arrays: relevance score, passage score,
+        # and (retrieved result index, sentence index) to look the sentence back up
+        score_parts = []
+        passage_score_parts = []
+        sentence_idx = []
         
-        for result in retrieved_results:
+        for r, result in enumerate(retrieved_results):
             passage = result['passage']
-            sentences = self.split_into_sentences(passage.text)
             
-            for sentence in sentences:
-                # Skip very short sentences (headers, labels, etc.)
-                if len(sentence.split()) < 5:
-                    continue
-                
-                # Score this sentence
-                relevance_score = self.score_sentence_relevance(sentence, keywords, query_lower)
-                
-                if relevance_score > 0:
-                    candidate_sentences.append({
-                        'sentence': sentence,
-                        'score': relevance_score,
-                        'source': passage.source,
-                        'passage_score': result['score']
-                    })
+            # Score all sentences of this passage in one kernel call
+            relevance_scores = _score_sentences(
+                passage.sentence_token_ids, passage.sentence_offsets,
+                passage.sentence_word_counts, passage.sentence_has_digit,
+                keyword_ids, query_word_ids)
+            
+            # Keep relevant sentences, skipping very short ones (headers, labels, etc.)
+            keep = np.flatnonzero((relevance_scores > 0) & (passage.sentence_word_counts >= 5))
+            score_parts.append(relevance_scores[keep])
+            passage_score_parts.append(np.full(len(keep), result['score']))
+            sentence_idx.extend((r, int(s)) for s in keep)
         
-        if debug:
-            print(f"\nFound {len(candidate_sentences)} candidate sentences")
-            for i, cand in enumerate(sorted(candidate_sentences, key=lambda x: x['score'], reverse=True)[:5], 1):
-                print(f"\n{i}. Relevance Score: {cand['score']}, Passage Score: {cand['passage_score']:.4f}")
-                print(f"   Source: {cand['source']}")
-                print(f"   Sentence: {cand['sentence'][:150]}...")
+        scores = np.concatenate(score_parts) if score_parts else np.zeros(0, dtype=np.int32)
+        passage_scores = np.concatenate(passage_score_parts) if passage_score_parts else np.zeros(0)
         
-        if not candidate_sentences:
+        def candidate(i):
+            r, s = sentence_idx[i]
+            passage = retrieved_results[r]['passage']
+            return passage.sentences[s], passage.source
+        
+        if debug:
+            print(f"\nFound {len(sentence_idx)} candidate sentences")
+            for i, c in enumerate(np.argsort(-scores, kind='stable')[:5], 1):
+                sentence, source = candidate(c)
+                print(f"\n{i}. Relevance Score: {scores[c]}, Passage Score: {passage_scores[c]:.4f}")
+                print(f"   Source: {source}")
+                print(f"   Sentence: {sentence[:150]}...")
+        
+        if not sentence_idx:
             # Fallback: use first sentence from top passage
             top_passage = retrieved_results[0]['passage']
-            sentences = self.split_into_sentences(top_passage.text)
+            sentences = top_passage.sentences
             best_sentence = sentences[0] if sentences else top_passage.text
             best_source = top_passage.source
         else:
-            # Sort by relevance score, then by passage score
-            candidate_sentences.sort(key=lambda x: (x['score'], x['passage_score']), reverse=True)
-            best = candidate_sentences[0]
-            best_sentence = best['sentence']
-            best_source = best['source']
+            # Sort by relevance score, then by passage score (both descending, ties keep order)
+            order = np.lexsort((-passage_scores, -scores))
+            best_sentence, best_source = candidate(order[0])
         
         # Clean up the sentence
         best_sentence = best_sentence.strip()
@@ -257,12 +541,13 @@ class RAGSystem:
         
         return best_sentence, [best_source]
     
-    def answer_query(self, query, k=3, debug=False):
+    def answer_query(self, query, k=3, debug=False, retrieved_results=None):
         """Main method to answer a query"""
         print(f"\nQuery: {query}")
         
-        # Retrieve relevant passages
-        retrieved_results = self.retrieve(query, k=k, debug=debug)
+        # Retrieve relevant passages (unless already retrieved in a batch)
+        if retrieved_results is None:
+            retrieved_results = self.retrieve(query, k=k, debug=debug)
         
         # Generate answer
         answer, sources = self.generate_answer(query, retrieved_results, debug=debug)
@@ -289,8 +574,10 @@ def run_tests(rag):
         "Does SafeGrill have auto-shutoff?"
     ]
     
-    for query in test_queries:
-        rag.answer_query(query, k=3, debug=False)
+    # Retrieve for all test queries in a single batch
+    batch_results = rag.retrieve_batch(test_queries, k=3)
+    for query, retrieved_results in zip(test_queries, batch_results):
+        rag.answer_query(query, k=3, debug=False, retrieved_results=retrieved_results)
 
 
 def main():
@@ -300,11 +587,14 @@ def main():
     parser.add_argument('--test', action='store_true', help='Run test queries')
     parser.add_argument('--docs-dir', type=str, default='docs', help='Documents directory')
     parser.add_argument('-k', type=int, default=3, help='Number of passages to retrieve')
+    parser.add_argument('--no-dense', action='store_true', help='Use TF-IDF retrieval only')
+    parser.add_argument('--embedding-model', type=str, default='BAAI/bge-small-en-v1.5',
+                        help='SentenceTransformer model for dense retrieval')
     
     args = parser.parse_args()
     
     # Initialize RAG system
-    rag = RAGSystem(docs_dir=args.docs_dir)
+    rag = RAGSystem(docs_dir=args.docs_dir, use_dense=not args.no_dense, embedding_model=args.embedding_model)
     
     # Ingest and index documents
     print("="*80)